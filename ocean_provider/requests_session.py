@@ -6,23 +6,30 @@ from requests.adapters import HTTPAdapter
 from requests.sessions import Session
 
 
-def get_requests_session() -> Session:
+def get_requests_session(max_retries: int = 1) -> Session:
     """
     Set connection pool maxsize and block value to avoid `connection pool full` warnings.
 
+    :param max_retries: retries of each adapter on connection errors
     :return: requests session
     """
     session = Session()
     session.mount(
         "http://",
         HTTPAdapter(
-            pool_connections=25, pool_maxsize=25, pool_block=True, max_retries=1
+            pool_connections=25,
+            pool_maxsize=25,
+            pool_block=True,
+            max_retries=max_retries,
         ),
     )
     session.mount(
         "https://",
         HTTPAdapter(
-            pool_connections=25, pool_maxsize=25, pool_block=True, max_retries=1
+            pool_connections=25,
+            pool_maxsize=25,
+            pool_block=True,
+            max_retries=max_retries,
         ),
     )
     return session
@@ -3,6 +3,7 @@
 # SPDX-License-Identifier: Apache-2.0
 #
 from datetime import datetime
+import functools
 import logging
 import os
 from typing import Optional, Union
@@ -10,7 +11,7 @@ from typing import Optional, Union
 import requests
 from eth_account import Account
 from hexbytes import HexBytes
-from ocean_provider.config import Config
+from ocean_provider.config import Config, environ_names
 from ocean_provider.http_provider import CustomHTTPProvider
 from requests_testadapter import Resp
 from web3.middleware import geth_poa_middleware
@@ -22,13 +23,30 @@ logger = logging.getLogger(__name__)
 
 def get_config(config_file: Optional[str] = None) -> Config:
     """
-    :return: Config instance
+    :return: Config instance, reused until the config file or the
+    environment overrides change
     """
-    return Config(
-        filename=config_file
+    filename = (
+        config_file
         if config_file is not None
         else os.getenv("PROVIDER_CONFIG_FILE", "config.ini")
     )
+    environ_overrides = tuple(
+        os.environ.get(environ_item[0]) for environ_item in environ_names.values()
+    )
+
+    # an empty filename builds the config from the environment only
+    mtime = os.stat(filename).st_mtime_ns if filename else None
+
+    return _load_config(filename, mtime, environ_overrides)
+
+
+@functools.lru_cache(maxsize=4)
+def _load_config(
+    filename: str, mtime: Optional[int], environ_overrides: tuple
+) -> Config:
+    # mtime and environ_overrides are only part of the cache key
+    return Config(filename=filename)
 
 
 def get_metadata_url():
@@ -3,9 +3,13 @@
 # SPDX-License-Identifier: Apache-2.0
 #
 from datetime import datetime, timedelta
+from unittest.mock import patch
+
 import pytest
 
 from ocean_provider.utils.basics import (
+    _load_config,
+    get_config,
     get_web3,
     get_web3_connection_provider,
     send_ether,
@@ -33,6 +37,27 @@ def test_get_web3_connection_provider(monkeypatch):
     assert provider.endpoint_uri == "wss://bah.com"
 
 
+@pytest.mark.unit
+def test_get_config_is_cached(monkeypatch):
+    _load_config.cache_clear()
+    try:
+        config = get_config()
+        assert get_config() is config
+
+        monkeypatch.setenv("ALLOW_NON_PUBLIC_IP", "1")
+        new_config = get_config()
+        assert new_config is not config
+        assert new_config.allow_non_public_ip is True
+
+        monkeypatch.setenv("PROVIDER_CONFIG_FILE", "")
+        with patch("ocean_provider.utils.basics.Config") as mock:
+            get_config()
+            mock.assert_called_once_with(filename="")
+    finally:
+        # do not leave the mocked or overridden configs to other tests
+        _load_config.cache_clear()
+
+
 @pytest.mark.unit
 def test_send_ether(publisher_wallet, consumer_address):
     assert send_ether(
@@ -6,6 +6,12 @@ import logging
 from requests.models import Response
 
 from ocean_provider.utils.url import (
+    _dns_cache,
+    _get_records,
+    _same_provider_cache,
+    check_url_details,
+    is_ip,
+    is_safe_domain,
     is_safe_url,
     is_this_same_provider,
     is_url,
@@ -24,6 +30,20 @@ def test_is_url():
     assert is_url("127.0.0.1") is False
     assert is_url("169.254.169.254") is False
     assert is_url("http://169.254.169.254/latest/meta-data/hostname") is True
+    assert is_url("http:///no-host") is False
+    assert is_url("http://?x=1") is False
+    assert is_url("http://#frag") is False
+    assert is_url(None) is False
+
+
+@pytest.mark.unit
+def test_is_ip():
+    assert is_ip("169.254.169.254") is True
+    assert is_ip("::1") is True
+    assert is_ip("2130706433") is True
+    assert is_ip("0x7f.1") is True
+    assert is_ip("jsonplaceholder.typicode.com") is False
+    assert is_ip("cafe.com") is False
 
 
 @pytest.mark.unit
@@ -44,6 +64,20 @@ def test_is_same_provider():
     assert is_this_same_provider("http://localhost:8030")
 
 
+@pytest.mark.unit
+def test_is_same_provider_is_cached(provider_address):
+    _same_provider_cache.clear()
+    provider_response = Mock(spec=Response)
+    provider_response.json.return_value = {"providerAddress": provider_address}
+
+    with patch("ocean_provider.utils.url.requests_session.get") as mock:
+        mock.return_value = provider_response
+        assert is_this_same_provider("http://some-provider.com:8030/api/services")
+        assert is_this_same_provider("http://some-provider.com:8030/")
+        assert mock.call_count == 1
+    _same_provider_cache.clear()
+
+
 @pytest.mark.unit
 def test_get_redirect():
     assert (
@@ -60,7 +94,7 @@ def test_get_redirect():
     normal_response.is_redirect = False
     normal_response.status_code = 200
 
-    with patch("ocean_provider.utils.url.requests.head") as mock:
+    with patch("ocean_provider.utils.url.requests_session.head") as mock:
         mock.side_effect = [redirect_response, normal_response]
         assert (
             get_redirect("https://some-url.com:3000/index")
@@ -76,7 +110,7 @@ def test_get_redirect():
     normal_response.is_redirect = False
     normal_response.status_code = 200
 
-    with patch("ocean_provider.utils.url.requests.head") as mock:
+    with patch("ocean_provider.utils.url.requests_session.head") as mock:
         mock.side_effect = [redirect_response, normal_response]
         assert (
             get_redirect("https://some-url.com:3000/index")
@@ -88,7 +122,86 @@ def test_get_redirect():
     redirect_response.status_code = 200
     redirect_response.headers = {"Location": "https://some-url.com:3000/index"}
 
-    with patch("ocean_provider.utils.url.requests.head") as mock:
+    with patch("ocean_provider.utils.url.requests_session.head") as mock:
         mock.return_value = redirect_response
         assert get_redirect("https://some-url.com:3000/index") is None
         assert mock.call_count == 6
+
+
+@pytest.mark.unit
+def test_get_records_is_cached():
+    _dns_cache.clear()
+    with patch("ocean_provider.utils.url.DNS_RESOLVER.resolve") as mock:
+        mock.return_value = ["1.1.1.1"]
+        assert _get_records("some-url.com", "A") == ["1.1.1.1"]
+        assert _get_records("some-url.com", "A") == ["1.1.1.1"]
+        assert mock.call_count == 1
+
+        mock.side_effect = Exception("NXDOMAIN")
+        assert _get_records("missing-url.com", "A") is None
+        assert _get_records("missing-url.com", "A") is None
+        assert mock.call_count == 2
+    _dns_cache.clear()
+
+
+@pytest.mark.unit
+def test_check_url_details_reuses_redirect_probe():
+    probe_response = Mock(spec=Response)
+    probe_response.status_code = 200
+    probe_response.headers = {"Content-Type": "text/plain", "Content-Length": "42"}
+
+    url_object = {"url": "https://some-url.com/file.txt", "type": "url"}
+    with patch(
+        "ocean_provider.utils.url._resolve_and_validate",
+        return_value=("https://some-url.com/file.txt", probe_response),
+    ), patch("ocean_provider.utils.url._get_result_from_url") as mock:
+        assert check_url_details(url_object) == (
+            True,
+            {"contentLength": "42", "contentType": "text/plain"},
+        )
+        mock.assert_not_called()
+
+
+@pytest.mark.unit
+def test_check_url_details_needs_content_type_to_reuse_probe():
+    probe_response = Mock(spec=Response)
+    probe_response.status_code = 200
+    probe_response.headers = {"Content-Length": "42"}
+
+    url_object = {"url": "https://some-url.com/file.txt", "type": "url"}
+    with patch(
+        "ocean_provider.utils.url._resolve_and_validate",
+        return_value=("https://some-url.com/file.txt", probe_response),
+    ), patch("ocean_provider.utils.url._get_result_from_url") as mock:
+        mock.return_value = (probe_response, {})
+        check_url_details(url_object)
+        mock.assert_called_once()
+
+
+@pytest.mark.unit
+def test_check_url_details_keeps_url_with_headers():
+    probe_response = Mock(spec=Response)
+    probe_response.status_code = 200
+    probe_response.headers = {"Content-Type": "text/plain", "Content-Length": "42"}
+
+    url_object = {
+        "url": "https://some-url.com/file.txt",
+        "type": "url",
+        "headers": {"APIKEY": "sample"},
+    }
+    with patch(
+        "ocean_provider.utils.url._resolve_and_validate",
+        return_value=("https://some-url.com/login", probe_response),
+    ), patch("ocean_provider.utils.url._get_result_from_url") as mock:
+        mock.return_value = (probe_response, {})
+        check_url_details(url_object)
+        assert mock.call_args.kwargs["url"] == "https://some-url.com/file.txt"
+
+
+@pytest.mark.unit
+def test_is_safe_domain_skips_dns_for_ips():
+    with patch("ocean_provider.utils.url._get_records") as mock:
+        assert is_safe_domain("8.8.8.8") is True
+        assert is_safe_domain("127.0.0.1") is False
+        assert is_safe_domain("2130706433") is False
+        mock.assert_not_called()
@@ -21,6 +21,7 @@ from ocean_provider.utils.services import Service
 from ocean_provider.utils.url import _get_result_from_url
 from ocean_provider.utils.util import (
     build_download_response,
+    get_content_disposition_filename,
     get_download_url,
     get_service_files_list,
     get_service_files_list_old_structure,
@@ -40,6 +41,35 @@ def test_msg_hash():
     assert hashed == expected
 
 
+@pytest.mark.unit
+def test_get_content_disposition_filename():
+    assert get_content_disposition_filename("attachment;filename=test.xml") == (
+        "test.xml"
+    )
+    assert get_content_disposition_filename('attachment; filename="a b.txt"') == (
+        "a b.txt"
+    )
+    assert get_content_disposition_filename("inline") is None
+
+    # filename* is not decoded into the outgoing header
+    assert (
+        get_content_disposition_filename("attachment; filename*=UTF-8''%E2%82%AC.txt")
+        is None
+    )
+    assert (
+        get_content_disposition_filename(
+            "attachment; filename*=UTF-8''a%0D%0ASet-Cookie:%20x=1"
+        )
+        is None
+    )
+    assert (
+        get_content_disposition_filename(
+            "attachment; filename*=UTF-8''%E2%82%AC.txt; filename=plain.txt"
+        )
+        == "plain.txt"
+    )
+
+
 @pytest.mark.unit
 def test_build_download_response():
     request = Mock()
@@ -60,8 +90,8 @@ def test_build_download_response():
     content_type = mimetypes.guess_type(filename)[0]
     url_object = {"url": f"https://source-lllllll.cccc/{filename}", "type": "url"}
     with patch(
-        "ocean_provider.utils.util.is_safe_url",
-        side_effect=[True],
+        "ocean_provider.utils.util.resolve_and_validate",
+        side_effect=lambda url, _: url,
     ):
         response = build_download_response(request, requests_session, url_object, None)
 
@@ -74,8 +104,8 @@ def test_build_download_response():
     filename = "<<filename>>"
     url_object = {"url": f"https://source-lllllll.cccc/{filename}", "type": "url"}
     with patch(
-        "ocean_provider.utils.util.is_safe_url",
-        side_effect=[True],
+        "ocean_provider.utils.util.resolve_and_validate",
+        side_effect=lambda url, _: url,
     ):
         response = build_download_response(request, requests_session, url_object, None)
     assert response.headers["content-type"] == get_content_type(
@@ -89,8 +119,8 @@ def test_build_download_response():
     filename = "<<filename>>"
     url_object = {"url": f"https://source-lllllll.cccc/{filename}", "type": "url"}
     with patch(
-        "ocean_provider.utils.util.is_safe_url",
-        side_effect=[True],
+        "ocean_provider.utils.util.resolve_and_validate",
+        side_effect=lambda url, _: url,
     ):
         response = build_download_response(
             request, requests_session, url_object, content_type
@@ -115,8 +145,8 @@ def test_build_download_response():
 
     url_object = {"url": "https://source-lllllll.cccc/not-a-filename", "type": "url"}
     with patch(
-        "ocean_provider.utils.util.is_safe_url",
-        side_effect=[True],
+        "ocean_provider.utils.util.resolve_and_validate",
+        side_effect=lambda url, _: url,
     ):
         response = build_download_response(
             request, requests_session_with_attachment, url_object, None
@@ -145,8 +175,8 @@ def test_build_download_response():
         "headers": {"APIKEY": "sample"},
     }
     with patch(
-        "ocean_provider.utils.util.is_safe_url",
-        side_effect=[True],
+        "ocean_provider.utils.util.resolve_and_validate",
+        side_effect=lambda url, _: url,
     ):
         response = build_download_response(
             request, requests_session_with_content_type, url_object, None
@@ -164,8 +194,8 @@ def test_build_download_response():
         "method": "DELETE",
     }
     with patch(
-        "ocean_provider.utils.util.is_safe_url",
-        side_effect=[True],
+        "ocean_provider.utils.util.resolve_and_validate",
+        side_effect=lambda url, _: url,
     ):
         with pytest.raises(ValueError, match="Unsafe method DELETE"):
             response = build_download_response(
@@ -173,6 +203,76 @@ def test_build_download_response():
             )
 
 
+@pytest.mark.unit
+def test_build_download_response_ignores_extended_filename():
+    request = Mock()
+    request.range = None
+
+    for content_disposition in [
+        "attachment; filename*=UTF-8''%E2%82%AC.txt",
+        "attachment; filename*=UTF-8''a%0D%0ASet-Cookie:%20x=1",
+    ]:
+        mocked_response = Mock()
+        mocked_response.status_code = 200
+        mocked_response.headers = {"content-disposition": content_disposition}
+        requests_session = Mock()
+        requests_session.get = MagicMock(return_value=mocked_response)
+
+        url_object = {"url": "https://source-lllllll.cccc/file.txt", "type": "url"}
+        with patch(
+            "ocean_provider.utils.util.resolve_and_validate",
+            side_effect=lambda url, _: url,
+        ):
+            response = build_download_response(
+                request, requests_session, url_object, None
+            )
+
+        assert (
+            response.headers.get_all("Content-Disposition")[0]
+            == "attachment;filename=file.txt"
+        )
+
+
+@pytest.mark.unit
+def test_build_download_response_keeps_url_with_headers():
+    request = Mock()
+    request.range = None
+
+    mocked_response = Mock()
+    mocked_response.status_code = 200
+    mocked_response.headers = {"content-type": "text/plain"}
+    requests_session = Mock()
+    requests_session.get = MagicMock(return_value=mocked_response)
+
+    url_object = {
+        "url": "https://source-lllllll.cccc/filename.txt",
+        "type": "url",
+        "headers": {"APIKEY": "sample"},
+    }
+    with patch(
+        "ocean_provider.utils.util.resolve_and_validate",
+        return_value="https://login.source-lllllll.cccc/",
+    ):
+        build_download_response(request, requests_session, url_object, None)
+
+    assert (
+        requests_session.get.call_args.kwargs["url"]
+        == "https://source-lllllll.cccc/filename.txt"
+    )
+
+    del url_object["headers"]
+    with patch(
+        "ocean_provider.utils.util.resolve_and_validate",
+        return_value="https://cdn.source-lllllll.cccc/filename.txt",
+    ):
+        build_download_response(request, requests_session, url_object, None)
+
+    assert (
+        requests_session.get.call_args.kwargs["url"]
+        == "https://cdn.source-lllllll.cccc/filename.txt"
+    )
+
+
 @pytest.mark.unit
 def test_httpbin():
     request = Mock()
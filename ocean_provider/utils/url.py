@@ -2,106 +2,191 @@
 # Copyright 2021 Ocean Protocol Foundation
 # SPDX-License-Identifier: Apache-2.0
 #
+import functools
 import hashlib
 import ipaddress
 import json
 import logging
 import os
+import re
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urlparse, urljoin
 
 import dns.resolver
 import requests
+from cachetools import TTLCache
+from ocean_provider.requests_session import get_requests_session
 from ocean_provider.utils.basics import get_config, get_provider_wallet
 
 logger = logging.getLogger(__name__)
 
 REQUEST_TIMEOUT = 3
-CHUNK_SIZE = 8192
+CHUNK_SIZE = 1024 * 1024
+MAX_REDIRECTS = 5
 
+requests_session = get_requests_session(max_retries=0)
 
-def get_redirect(url, redirect_count=0):
-    if not is_url(url):
-        return None
+DNS_RESOLVER = dns.resolver.Resolver()
+DNS_CACHE_TTL = 60
+_dns_cache = TTLCache(maxsize=1024, ttl=DNS_CACHE_TTL)
+_dns_cache_lock = threading.Lock()
+_dns_executor = ThreadPoolExecutor(max_workers=8)
+# marks a failed lookup, so that negative results are cached as well
+_NO_RECORDS = object()
 
-    if redirect_count > 5:
-        logger.info(f"More than 5 redirects for url {url}. Aborting.")
+SAME_PROVIDER_CACHE_TTL = 300
+_same_provider_cache = TTLCache(maxsize=128, ttl=SAME_PROVIDER_CACHE_TTL)
+_same_provider_cache_lock = threading.Lock()
 
-        return None
+_URL_RE = re.compile(r"^[a-zA-Z][a-zA-Z0-9+.\-]*://[^/?#\s]+")
+# numeric hosts that inet_aton still turns into an address, e.g. "2130706433"
+# or "0x7f.1" for 127.0.0.1
+_NUMERIC_HOST_RE = re.compile(
+    r"^(0x[0-9a-f]*|[0-9]+)(\.(0x[0-9a-f]*|[0-9]+))*\.?$", re.IGNORECASE
+)
+
+
+def get_redirect(url, session=None):
+    return _follow_redirects(url, session)[0]
+
+
+def _follow_redirects(url, session=None):
+    """
+    Follows the redirects of url.
+    Returns the final url and the response received from it, or a pair of
+    None values if the url is invalid or redirects too many times.
+    """
+    session = session or requests_session
+
+    for _ in range(MAX_REDIRECTS + 1):
+        if not is_url(url):
+            return None, None
+
+        result = session.head(url, allow_redirects=False, timeout=REQUEST_TIMEOUT)
 
-    result = requests.head(url, allow_redirects=False)
+        if result.status_code == 405:
+            # HEAD not allowed, so defaulting to get
+            result = session.get(url, allow_redirects=False, timeout=REQUEST_TIMEOUT)
 
-    if result.status_code == 405:
-        # HEAD not allowed, so defaulting to get
-        result = requests.get(url, allow_redirects=False)
+        if not result.is_redirect:
+            return url, result
 
-    if result.is_redirect:
         location = urljoin(
             url if url.endswith("/") else f"{url}/", result.headers["Location"]
         )
         logger.info(f"Redirecting for url {url} to location {location}.")
+        url = location
 
-        return get_redirect(location, redirect_count + 1)
+    logger.info(f"More than {MAX_REDIRECTS} redirects for url {url}. Aborting.")
 
-    return url
+    return None, None
 
 
-def is_safe_url(url):
-    url = get_redirect(url)
+def is_safe_url(url, session=None):
+    return resolve_and_validate(url, session) is not None
 
-    if not url:
-        return False
 
-    result = urlparse(url)
+def resolve_and_validate(url, session=None):
+    """
+    Returns the url reached after following redirects, or None if the url is
+    invalid or its final domain is not safe.
+    """
+    return _resolve_and_validate(url, session)[0]
+
 
-    return is_safe_domain(result.hostname)
+def _resolve_and_validate(url, session=None):
+    # resolve the domain while the redirects are followed, most urls do not
+    # redirect to another domain and is_safe_domain then hits the dns cache
+    dns_futures = []
+    domain = urlparse(url).hostname if is_url(url) else None
+    if domain and not is_ip(domain):
+        dns_futures = [
+            _dns_executor.submit(_get_records, domain, record_type)
+            for record_type in ("A", "AAAA")
+        ]
+
+    url, result = _follow_redirects(url, session)
+    for dns_future in dns_futures:
+        dns_future.result()
+
+    if not url or not is_safe_domain(urlparse(url).hostname):
+        return None, None
+
+    return url, result
 
 
 def is_url(url):
-    try:
-        result = urlparse(url)
-        return all([result.scheme, result.netloc])
-    except:  # noqa
-        return False
+    return isinstance(url, str) and _URL_RE.match(url) is not None
 
 
 def is_ip(address):
-    return address.replace(".", "").isnumeric()
+    try:
+        ipaddress.ip_address(address)
+        return True
+    except ValueError:
+        return _NUMERIC_HOST_RE.match(address) is not None
 
 
 def is_this_same_provider(url):
     result = urlparse(url)
+    key = (result.scheme, result.netloc)
+    with _same_provider_cache_lock:
+        if key in _same_provider_cache:
+            return _same_provider_cache[key]
+
     try:
-        provider_info = requests.get(f"{result.scheme}://{result.netloc}/").json()
+        provider_info = requests_session.get(
+            f"{result.scheme}://{result.netloc}/"
+        ).json()
         address = provider_info["providerAddress"]
     except (requests.exceptions.RequestException, KeyError):
-        address = None
+        # not cached, the provider may just be unreachable for now
+        return None
 
-    return address and address.lower() == get_provider_wallet().address.lower()
+    is_same = address and address.lower() == get_provider_wallet().address.lower()
+    with _same_provider_cache_lock:
+        _same_provider_cache[key] = is_same
+
+    return is_same
 
 
 def _get_records(domain, record_type):
-    DNS_RESOLVER = dns.resolver.Resolver()
+    key = (domain, record_type)
+    with _dns_cache_lock:
+        records = _dns_cache.get(key)
+
+    if records is None:
+        records = _resolve_records(domain, record_type)
+        with _dns_cache_lock:
+            _dns_cache[key] = records
+
+    return None if records is _NO_RECORDS else records
+
+
+def _resolve_records(domain, record_type):
     try:
         return DNS_RESOLVER.resolve(domain, record_type, search=True)
     except Exception as e:
         logger.info(f"[i] Cannot get {record_type} record for domain {domain}: {e}\n")
 
-        return None
+        return _NO_RECORDS
 
 
 def is_safe_domain(domain):
+    if is_ip(domain):
+        # connections go straight to the address, its dns records do not matter
+        return validate_dns_record(domain, domain, "")
+
+    ip_v6_future = _dns_executor.submit(_get_records, domain, "AAAA")
     ip_v4_records = _get_records(domain, "A")
-    ip_v6_records = _get_records(domain, "AAAA")
+    ip_v6_records = ip_v6_future.result()
 
-    result = validate_dns_records(domain, ip_v4_records, "A") and validate_dns_records(
+    return validate_dns_records(domain, ip_v4_records, "A") and validate_dns_records(
         domain, ip_v6_records, "AAAA"
     )
 
-    if not is_ip(domain):
-        return result
-
-    return result and validate_dns_record(domain, domain, "")
-
 
 def validate_dns_records(domain, records, record_type):
     """
@@ -111,21 +196,21 @@ def validate_dns_records(domain, records, record_type):
     if records is None:
         return True
 
-    for record in records:
-        if not validate_dns_record(record, domain, record_type):
-            return False
+    allow_non_public_ip = get_config().allow_non_public_ip
 
-    return True
+    return all(
+        validate_dns_record(record, domain, record_type, allow_non_public_ip)
+        for record in records
+    )
 
 
-def validate_dns_record(record, domain, record_type):
-    value = record if isinstance(record, str) else record.to_text().strip()
-    allow_non_public_ip = get_config().allow_non_public_ip
+def validate_dns_record(record, domain, record_type, allow_non_public_ip=None):
+    value = record if isinstance(record, str) else record.to_text()
+    if allow_non_public_ip is None:
+        allow_non_public_ip = get_config().allow_non_public_ip
 
     try:
-        ip = ipaddress.ip_address(value)
-        # noqa See https://docs.python.org/3/library/ipaddress.html#ipaddress.IPv4Address.is_global
-        if ip.is_private or ip.is_reserved or ip.is_loopback:
+        if _is_non_public_ip(value):
             if allow_non_public_ip:
                 logger.warning(
                     f"[!] DNS record type {record_type} for domain name "
@@ -147,14 +232,28 @@ def validate_dns_record(record, domain, record_type):
     return True
 
 
+@functools.lru_cache(maxsize=4096)
+def _is_non_public_ip(value):
+    """Raises ValueError if value is not an ip address."""
+    ip = ipaddress.ip_address(value)
+    # noqa See https://docs.python.org/3/library/ipaddress.html#ipaddress.IPv4Address.is_global
+    return ip.is_private or ip.is_reserved or ip.is_loopback
+
+
 def get_download_url(url_object):
     if url_object["type"] != "ipfs":
         return url_object["url"]
 
-    if not os.getenv("IPFS_GATEWAY"):
+    ipfs_gateway = os.getenv("IPFS_GATEWAY")
+    if not ipfs_gateway:
         raise Exception("No IPFS_GATEWAY defined, can not resolve ipfs hash.")
 
-    return urljoin(os.getenv("IPFS_GATEWAY"), urljoin("ipfs/", url_object["hash"]))
+    return _get_ipfs_url(ipfs_gateway, url_object["hash"])
+
+
+@functools.lru_cache(maxsize=1024)
+def _get_ipfs_url(ipfs_gateway, ipfs_hash):
+    return urljoin(ipfs_gateway, urljoin("ipfs/", ipfs_hash))
 
 
 def check_url_details(url_object, with_checksum=False):
@@ -166,16 +265,29 @@ def check_url_details(url_object, with_checksum=False):
     """
     url = get_download_url(url_object)
     try:
-        if not is_safe_url(url):
+        resolved_url, result = _resolve_and_validate(url)
+        if not resolved_url:
             return False, {}
 
-        for _ in range(int(os.getenv("REQUEST_RETRIES", 1))):
-            result, extra_data = _get_result_from_url(
-                url_object,
-                with_checksum=with_checksum,
-            )
-            if result and result.status_code == 200:
-                break
+        if is_plain_get_request(url_object):
+            url = resolved_url
+
+        extra_data = {}
+        if not _can_reuse_probe(url_object, result, with_checksum):
+            for _ in range(int(os.getenv("REQUEST_RETRIES", 1))):
+                if result is not None:
+                    # release the pooled connection of the previous attempt
+                    result.close()
+                result, extra_data = _get_result_from_url(
+                    url_object,
+                    with_checksum=with_checksum,
+                    url=url,
+                )
+                if result and result.status_code == 200:
+                    break
+
+        # only the headers are needed, release the pooled connection
+        result.close()
 
         if result.status_code == 200:
             content_type = result.headers.get("Content-Type")
@@ -190,10 +302,7 @@ def check_url_details(url_object, with_checksum=False):
                     pass
 
             if content_type:
-                try:
-                    content_type = content_type.split(";")[0]
-                except IndexError:
-                    pass
+                content_type = content_type.partition(";")[0]
 
             if content_type or content_length:
                 details = {
@@ -211,58 +320,111 @@ def check_url_details(url_object, with_checksum=False):
     return False, {}
 
 
-def _get_result_from_url(url_object, with_checksum=False):
+def is_plain_get_request(url_object):
+    """
+    Whether url_object is a GET request without headers or userdata. Only such
+    requests are reproduced by the HEAD requests that follow the redirects, so
+    only they may be sent to the url those redirects lead to.
+    """
+    return (
+        url_object.get("method", "GET").lower() == "get"
+        and not url_object.get("headers")
+        and not url_object.get("userdata")
+    )
+
+
+def _has_content_details(result):
+    return bool(
+        result.status_code == 200
+        and (result.headers.get("Content-Type") or result.headers.get("Content-Range"))
+        and result.headers.get("Content-Length")
+    )
+
+
+def _can_reuse_probe(url_object, result, with_checksum):
+    """
+    Whether the response received while following redirects can stand in for
+    the lightweight requests of `_get_result_from_url`.
+    """
+    return (
+        result is not None
+        and not with_checksum
+        and is_plain_get_request(url_object)
+        and _has_content_details(result)
+    )
+
+
+def _get_result_from_url(url_object, with_checksum=False, url=None, session=None):
     method = url_object.get("method", "GET")
     headers = url_object.get("headers", {})
-    url = get_download_url(url_object)
+    if url is None:
+        url = get_download_url(url_object)
+    session = session or requests_session
+    userdata = format_userdata(url_object.get("userdata"))
 
     lightweight_methods = [] if method.lower() == "post" else ["head", "options"]
     heavyweight_method = method.lower()
 
     for method in lightweight_methods:
-        func = getattr(requests, method)
+        func = getattr(session, method)
         result = func(
             url,
             timeout=REQUEST_TIMEOUT,
             headers=headers,
-            params=format_userdata(url_object.get("userdata")),
+            params=userdata,
         )
 
-        if (
-            not with_checksum
-            and result.status_code == 200
-            and (
-                result.headers.get("Content-Type")
-                or result.headers.get("Content-Range")
-            )
-            and result.headers.get("Content-Length")
-        ):
+        if not with_checksum and _has_content_details(result):
             return result, {}
 
-    func = getattr(requests, heavyweight_method)
+    func = getattr(session, heavyweight_method)
     func_args = {"url": url, "stream": True, "headers": headers}
 
     if "userdata" in url_object:
         if heavyweight_method != "post":
-            func_args["params"] = format_userdata(url_object.get("userdata"))
+            func_args["params"] = userdata
         else:
-            func_args["json"] = format_userdata(url_object.get("userdata"))
+            func_args["json"] = userdata
 
     if not with_checksum:
         # fallback on GET request
         func_args["timeout"] = REQUEST_TIMEOUT
         return func(**func_args), {}
 
-    sha = hashlib.sha256()
-
     with func(**func_args) as r:
         r.raise_for_status()
-        for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
-            sha.update(chunk)
+        sha = _sha256_of_response(r)
 
     return r, {"checksum": sha.hexdigest(), "checksumType": "sha256"}
 
 
+class _HashSink:
+    """File-like object that feeds everything written to it into a hash."""
+
+    def __init__(self, hash_object):
+        self.write = hash_object.update
+
+
+def _sha256_of_response(response):
+    """Hashes the decoded body of a streamed response."""
+    if response.headers.get("Content-Encoding", "identity") != "identity":
+        # the raw stream is encoded, let requests decode it
+        sha = hashlib.sha256()
+        for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+            sha.update(chunk)
+
+        return sha
+
+    if hasattr(hashlib, "file_digest"):
+        # python 3.11+
+        return hashlib.file_digest(response.raw, "sha256")
+
+    sha = hashlib.sha256()
+    shutil.copyfileobj(response.raw, _HashSink(sha), CHUNK_SIZE)
+
+    return sha
+
+
 def format_userdata(userdata):
     if not userdata:
         return None
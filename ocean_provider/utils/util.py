@@ -2,16 +2,18 @@
 # Copyright 2021 Ocean Protocol Foundation
 # SPDX-License-Identifier: Apache-2.0
 #
+import functools
 import hashlib
 import json
 import logging
 import mimetypes
 import os
-from cgi import parse_header
+import re
 from typing import Tuple
 from ocean_provider.utils.asset import Asset
 import werkzeug
 
+from eth_account import Account
 from eth_account.signers.local import LocalAccount
 from eth_keys import KeyAPI
 from eth_keys.backends import NativeECCBackend
@@ -19,13 +21,36 @@ from eth_typing.encoding import HexStr
 from flask import Response
 from ocean_provider.utils.encryption import do_decrypt
 from ocean_provider.utils.services import Service
-from ocean_provider.utils.url import is_safe_url, format_userdata, get_download_url
+from ocean_provider.utils.url import (
+    format_userdata,
+    get_download_url,
+    is_plain_get_request,
+    resolve_and_validate,
+)
 from web3 import Web3
 from web3.types import TxParams, TxReceipt
 
 logger = logging.getLogger(__name__)
 keys = KeyAPI(NativeECCBackend)
 
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+FILES_REQUIRED_KEYS = frozenset({"datatokenAddress", "nftAddress", "files"})
+
+# only the plain filename parameter, the decoded text of an RFC 2231
+# filename* parameter could carry characters that are not valid in headers
+_CONTENT_DISPOSITION_FILENAME_RE = re.compile(
+    r';\s*filename\s*=\s*(?:"((?:[^"\\]|\\.)*)"|([^;]*))', re.IGNORECASE
+)
+_QUOTED_PAIR_RE = re.compile(r"\\(.)")
+
+# load the mime types database at import, not on the first download
+mimetypes.init()
+
+
+@functools.lru_cache(maxsize=256)
+def _guess_extension(content_type):
+    return mimetypes.guess_extension(content_type)
+
 
 def get_request_data(request):
     try:
@@ -35,9 +60,26 @@ def get_request_data(request):
 
 
 def msg_hash(message: str):
+    """
+    Sha256 hex digest of message. It is compared against the filesChecksum and
+    containerSectionChecksum values that publishers compute, so the algorithm is
+    part of the protocol.
+    """
     return hashlib.sha256(message.encode("utf-8")).hexdigest()
 
 
+def get_content_disposition_filename(content_disposition_header):
+    match = _CONTENT_DISPOSITION_FILENAME_RE.search(content_disposition_header)
+    if not match:
+        return None
+
+    quoted_filename, filename = match.groups()
+    if quoted_filename is not None:
+        filename = _QUOTED_PAIR_RE.sub(r"\1", quoted_filename)
+
+    return filename.strip() or None
+
+
 def build_download_response(
     request,
     requests_session,
@@ -50,8 +92,13 @@ def build_download_response(
     url_headers = url_object.get("headers", {})
 
     try:
-        if validate_url and not is_safe_url(url):
-            raise ValueError(f"Unsafe url {url}")
+        download_url = url
+        if validate_url:
+            resolved_url = resolve_and_validate(url, requests_session)
+            if not resolved_url:
+                raise ValueError(f"Unsafe url {url}")
+            if is_plain_get_request(url_object):
+                download_url = resolved_url
         download_request_headers = {}
         download_response_headers = {}
         is_range_request = bool(request.range)
@@ -67,17 +114,18 @@ def build_download_response(
 
         func_method = getattr(requests_session, method.lower())
         func_args = {
-            "url": url,
+            "url": download_url,
             "headers": download_request_headers,
             "stream": True,
             "timeout": 3,
         }
 
         if "userdata" in url_object:
+            userdata = format_userdata(url_object.get("userdata"))
             if method.lower() != "post":
-                func_args["params"] = format_userdata(url_object.get("userdata"))
+                func_args["params"] = userdata
             else:
-                func_args["json"] = format_userdata(url_object.get("userdata"))
+                func_args["json"] = userdata
 
         response = func_method(**func_args)
         if not is_range_request:
@@ -85,8 +133,9 @@ def build_download_response(
 
             content_disposition_header = response.headers.get("content-disposition")
             if content_disposition_header:
-                _, content_disposition_params = parse_header(content_disposition_header)
-                content_filename = content_disposition_params.get("filename")
+                content_filename = get_content_disposition_filename(
+                    content_disposition_header
+                )
                 if content_filename:
                     filename = content_filename
 
@@ -99,7 +148,7 @@ def build_download_response(
                 content_type = mimetypes.guess_type(filename)[0]
             elif not file_ext and content_type:
                 # add an extension to filename based on the content_type
-                extension = mimetypes.guess_extension(content_type)
+                extension = _guess_extension(content_type)
                 if extension:
                     filename = filename + extension
 
@@ -110,9 +159,8 @@ def build_download_response(
             }
 
         def _generate(_response):
-            for chunk in _response.iter_content(chunk_size=4096):
-                if chunk:
-                    yield chunk
+            # urllib3 only yields non empty chunks
+            yield from _response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE)
 
         return Response(
             _generate(response),
@@ -139,20 +187,16 @@ def get_service_files_list(
 
         files_json = json.loads(files_str)
 
-        for key in ["datatokenAddress", "nftAddress", "files"]:
-            if key not in files_json:
-                raise Exception(f"Key {key} not found in files.")
+        missing_keys = FILES_REQUIRED_KEYS - files_json.keys()
+        if missing_keys:
+            raise Exception(f"Keys {sorted(missing_keys)} not found in files.")
 
-        if Web3.toChecksumAddress(
-            files_json["datatokenAddress"]
-        ) != Web3.toChecksumAddress(service.datatoken_address):
+        if files_json["datatokenAddress"].lower() != service.datatoken_address.lower():
             raise Exception(
                 f"Mismatch of datatoken. Got {files_json['datatokenAddress']} vs expected {service.datatoken_address}"
             )
 
-        if Web3.toChecksumAddress(files_json["nftAddress"]) != Web3.toChecksumAddress(
-            asset.nftAddress
-        ):
+        if files_json["nftAddress"].lower() != asset.nftAddress.lower():
             raise Exception(
                 f"Mismatch of dataNft. Got {files_json['nftAddress']} vs expected {asset.nftAddress}"
             )
@@ -207,6 +251,11 @@ def validate_url_object(url_object, service_id=""):
     return True, ""
 
 
+@functools.lru_cache(maxsize=16)
+def _account_from_key(private_key) -> LocalAccount:
+    return Account.from_key(private_key)
+
+
 def sign_tx(web3, tx, private_key):
     """
     :param web3: Web3 object instance
@@ -214,7 +263,7 @@ def sign_tx(web3, tx, private_key):
     :param private_key: Private key of the account
     :return: rawTransaction (str)
     """
-    account = web3.eth.account.from_key(private_key)
+    account = _account_from_key(private_key)
     nonce = web3.eth.get_transaction_count(account.address)
     tx["nonce"] = nonce
     signed_tx = web3.eth.account.sign_transaction(tx, private_key)
@@ -37,6 +37,7 @@ install_requirements = [
     "coincurve>=13,<15",
     "ipaddress",
     "dnspython",
+    "cachetools",
     "flask-sieve==1.3.1",
     "SQLAlchemy==1.3.23",
     "json-sempai==0.4.0",